@@ -155,6 +155,7 @@ class SubiquityClient(TuiApplication):
             return
         if self.urwid_loop is not None:
             self.urwid_loop.stop()
+        self.error_reporter.flush_meta()
         cmdline = ['snap', 'run', 'subiquity']
         if self.opts.dry_run:
             cmdline = [
@@ -393,6 +394,7 @@ class SubiquityClient(TuiApplication):
 
     def exit(self):
         self._remove_last_screen()
+        self.error_reporter.flush_meta()
         super().exit()
 
     def select_initial_screen(self):
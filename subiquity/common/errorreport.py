@@ -22,14 +22,15 @@ import sys
 import time
 import traceback
 
-import apport
-import apport.crashdb
-import apport.hookutils
-
 import attr
 
 import bson
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 import requests
 
 import urwid
@@ -38,6 +39,7 @@ from subiquitycore.async_helpers import (
     run_in_thread,
     schedule_task,
     )
+from subiquitycore.file_util import write_file
 
 from subiquity.common.types import (
     ErrorReportKind,
@@ -48,6 +50,20 @@ from subiquity.common.types import (
 
 log = logging.getLogger('subiquitycore.common.errorreport')
 
+_KIND_BY_NAME = {kind.name: kind for kind in ErrorReportKind}
+
+
+def _dump_meta(meta):
+    if orjson is not None:
+        return orjson.dumps(meta)
+    return json.dumps(meta, separators=(',', ':')).encode('utf-8')
+
+
+def _load_meta(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data.decode('utf-8'))
+
 
 @attr.s(cmp=False)
 class Upload(metaclass=urwid.MetaSignals):
@@ -80,7 +96,7 @@ class Upload(metaclass=urwid.MetaSignals):
         os.close(self.pipe_r)
 
 
-@attr.s(cmp=False)
+@attr.s(cmp=False, slots=True)
 class ErrorReport(metaclass=urwid.MetaSignals):
 
     signals = ["changed"]
@@ -92,19 +108,30 @@ class ErrorReport(metaclass=urwid.MetaSignals):
     _file = attr.ib()
     _context = attr.ib()
     _info_task = attr.ib(default=None)
+    _load_task = attr.ib(default=None)
+    _meta_dirty = attr.ib(default=False)
+    _meta_flush_handle = attr.ib(default=None)
 
     meta = attr.ib(default=attr.Factory(dict))
     uploader = attr.ib(default=None)
 
+    # Where urwid keeps the connected signal handlers.
+    _urwid_signals = attr.ib(init=False, repr=False)
+
     @classmethod
     def new(cls, reporter, kind):
+        # apport is slow to import and most runs never need it, so it is
+        # only imported when a report is created or loaded.
+        import apport
         base = "{:.9f}.{}".format(time.time(), kind.name.lower())
+        # apport writes the report out in many small pieces, so give the
+        # file a large buffer to turn them into a few big writes.
         crash_file = open(
             os.path.join(reporter.crash_directory, base + ".crash"),
-            'wb')
+            'wb', buffering=1 << 20)
 
         pr = apport.Report('Bug')
-        pr['CrashDB'] = repr(reporter.crashdb_spec)
+        pr['CrashDB'] = reporter.crashdb_spec_repr
 
         r = cls(
             reporter=reporter, base=base, pr=pr, file=crash_file,
@@ -115,28 +142,36 @@ class ErrorReport(metaclass=urwid.MetaSignals):
 
     @classmethod
     def from_file(cls, reporter, fpath):
-        base = os.path.splitext(os.path.basename(fpath))[0]
+        import apport
+        base = os.path.basename(fpath)[:-len('.crash')]
         report = cls(
             reporter, base, pr=apport.Report(date='???'),
-            state=ErrorReportState.LOADING, file=open(fpath, 'rb'),
+            state=ErrorReportState.LOADING, file=None,
             context=reporter.context.child(base))
         try:
-            fp = open(report.meta_path, 'r')
+            fp = open(report.meta_path, 'rb')
         except FileNotFoundError:
             pass
         else:
             with fp:
-                report.meta = json.load(fp)
+                report.meta = _load_meta(fp.read())
         return report
 
     def add_info(self, _bg_attach_hook, wait=False):
+        import apport.hookutils
+
         def _bg_add_info():
             _bg_attach_hook()
             # Add basic info to report.
             self.pr.add_proc_info()
             self.pr.add_os_info()
-            self.pr.add_hooks_info(None)
-            apport.hookutils.attach_hardware(self.pr)
+            # The package hooks and hardware details take a long time to
+            # collect and are not useful in dry-run mode, and a crash in
+            # the UI is not going to be about the hardware.
+            if not self.reporter.dry_run:
+                self.pr.add_hooks_info(None)
+                if self.kind != ErrorReportKind.UI:
+                    apport.hookutils.attach_hardware(self.pr)
             # Because apport-cli will in general be run on a different
             # machine, we make some slightly obscure alterations to the report
             # to make this go better.
@@ -167,11 +202,18 @@ class ErrorReport(metaclass=urwid.MetaSignals):
                     self.state = ErrorReportState.DONE
                 self._file.close()
                 self._file = None
+                self.flush_meta()
                 urwid.emit_signal(self, "changed")
         if wait:
             with self._context.child("add_info") as context:
-                _bg_add_info()
+                try:
+                    _bg_add_info()
+                finally:
+                    self._file.close()
+                    self._file = None
                 context.description = "written to " + self.path
+                self.state = ErrorReportState.DONE
+            self.flush_meta()
         else:
             self._info_task = asyncio.get_event_loop().create_task(add_info())
 
@@ -179,16 +221,20 @@ class ErrorReport(metaclass=urwid.MetaSignals):
         with self._context.child("load"):
             # Load report from disk in background.
             try:
-                await run_in_thread(self.pr.load, self._file)
+                with open(self.path, 'rb') as fp:
+                    await run_in_thread(self.pr.load, fp)
             except Exception:
                 log.exception("loading problem report failed")
                 self.state = ErrorReportState.ERROR_LOADING
             else:
                 self.state = ErrorReportState.DONE
-        self._file.close()
-        self._file = None
         urwid.emit_signal(self, "changed")
 
+    def ensure_loaded(self):
+        """Start loading the report from disk, if not already done."""
+        if self.state == ErrorReportState.LOADING and self._load_task is None:
+            self._load_task = schedule_task(self.load())
+
     def upload(self):
         uploader = self.uploader = Upload(bytes_to_send=1)
 
@@ -267,9 +313,33 @@ class ErrorReport(metaclass=urwid.MetaSignals):
         return self._path_with_ext('crash')
 
     def set_meta(self, key, value):
+        # Updates often come in bursts (e.g. "kind" and "seen"), so rather
+        # than rewriting the meta file on every change, coalesce them into
+        # one write shortly afterwards.
         self.meta[key] = value
-        with open(self.meta_path, 'w') as fp:
-            json.dump(self.meta, fp, indent=4)
+        self._meta_dirty = True
+        if self._meta_flush_handle is None:
+            self._meta_flush_handle = asyncio.get_event_loop().call_later(
+                0.05, self._flush_meta)
+
+    def _flush_meta(self):
+        self._meta_flush_handle = None
+        if not self._meta_dirty:
+            return
+        self._meta_dirty = False
+        # This usually runs as a loop callback, where an exception would
+        # end up in the loop's exception handler (and so quite possibly
+        # in another crash report).
+        try:
+            write_file(self.meta_path, _dump_meta(self.meta))
+        except OSError:
+            log.exception("writing meta for %s failed", self.base)
+
+    def flush_meta(self):
+        """Write any pending meta changes to disk now."""
+        if self._meta_flush_handle is not None:
+            self._meta_flush_handle.cancel()
+        self._flush_meta()
 
     def mark_seen(self):
         self.set_meta("seen", True)
@@ -278,7 +348,7 @@ class ErrorReport(metaclass=urwid.MetaSignals):
     @property
     def kind(self):
         k = self.meta.get("kind", "UNKNOWN")
-        return getattr(ErrorReportKind, k, ErrorReportKind.UNKNOWN)
+        return _KIND_BY_NAME.get(k, ErrorReportKind.UNKNOWN)
 
     @property
     def seen(self):
@@ -291,30 +361,17 @@ class ErrorReport(metaclass=urwid.MetaSignals):
     @property
     def persistent_details(self):
         """Return fs-label, path-on-fs to report."""
-        # Not sure if this is more or less sane than shelling out to
-        # findmnt(1).
-        looking_for = os.path.abspath(
-            os.path.normpath(self.reporter.crash_directory))
-        for line in open('/proc/self/mountinfo').readlines():
-            parts = line.strip().split()
-            if os.path.normpath(parts[4]) == looking_for:
-                devname = parts[9]
-                root = parts[3]
-                break
-        else:
+        crash_fs = self.reporter.crash_fs
+        if crash_fs is None:
             if self.reporter.dry_run:
                 path = ('install-logs/2019-11-06.0/crash/' +
                         self.base +
                         '.crash')
                 return "casper-rw", path
             return None, None
-        import pyudev
-        c = pyudev.Context()
-        devs = list(c.list_devices(
-            subsystem='block', DEVNAME=os.path.realpath(devname)))
-        if not devs:
+        label, root = crash_fs
+        if label is None:
             return None, None
-        label = devs[0].get('ID_FS_LABEL_ENC', '')
         return label, root[1:] + '/' + self.base + '.crash'
 
     def ref(self):
@@ -327,6 +384,9 @@ class ErrorReport(metaclass=urwid.MetaSignals):
             )
 
 
+_UNRESOLVED = object()
+
+
 class ErrorReporter(object):
 
     def __init__(self, context, dry_run, root, client=None):
@@ -344,28 +404,63 @@ class ErrorReporter(object):
             }
         if dry_run:
             self.crashdb_spec['launchpad_instance'] = 'staging'
+        self.crashdb_spec_repr = repr(self.crashdb_spec)
         self._apport_data = []
         self._apport_files = []
+        self._crash_fs = _UNRESOLVED
+
+    def _resolve_crash_fs(self):
+        # Not sure if this is more or less sane than shelling out to
+        # findmnt(1).
+        looking_for = os.path.abspath(os.path.normpath(self.crash_directory))
+        with open('/proc/self/mountinfo') as fp:
+            for line in fp:
+                parts = line.split(None, 10)
+                if os.path.normpath(parts[4]) == looking_for:
+                    devname = parts[9]
+                    root = parts[3]
+                    break
+            else:
+                return None
+        import pyudev
+        c = pyudev.Context()
+        try:
+            dev = pyudev.Devices.from_device_file(
+                c, os.path.realpath(devname))
+        except pyudev.DeviceNotFoundError:
+            return None, None
+        return dev.get('ID_FS_LABEL_ENC', ''), root
+
+    @property
+    def crash_fs(self):
+        """Return (fs-label, root) of the fs holding the crash directory.
+
+        Returns None if the crash directory is not a mount point. The
+        answer does not change during a session, so it is only looked up
+        once.
+        """
+        if self._crash_fs is _UNRESOLVED:
+            self._crash_fs = self._resolve_crash_fs()
+        return self._crash_fs
 
     def load_reports(self):
+        # Parsing a report can be slow and most sessions never look at any,
+        # so reports are only loaded when something wants to show them (see
+        # ErrorReport.ensure_loaded).
         os.makedirs(self.crash_directory, exist_ok=True)
-        filenames = os.listdir(self.crash_directory)
-        to_load = []
-        for filename in sorted(filenames, reverse=True):
-            base, ext = os.path.splitext(filename)
-            if ext != ".crash":
-                continue
+        with os.scandir(self.crash_directory) as it:
+            entries = [e for e in it if e.name.endswith('.crash')]
+        entries.sort(key=lambda e: e.name, reverse=True)
+        for entry in entries:
+            base = entry.name[:-len('.crash')]
             if base not in self._reports_by_base:
-                path = os.path.join(self.crash_directory, filename)
-                r = ErrorReport.from_file(self, path)
+                r = ErrorReport.from_file(self, entry.path)
                 self.reports.append(r)
                 self._reports_by_base[base] = r
-                to_load.append(r)
-        schedule_task(self._load_reports(to_load))
 
-    async def _load_reports(self, to_load):
-        for report in to_load:
-            await report.load()
+    def flush_meta(self):
+        for report in self.reports:
+            report.flush_meta()
 
     def note_file_for_apport(self, key, path):
         self._apport_files.append((key, path))
@@ -405,6 +500,7 @@ class ErrorReporter(object):
         log.info(
             "saving crash report %r to %s", report.pr["Title"], report.path)
 
+        import apport.hookutils
         apport_files = self._apport_files[:]
         apport_data = self._apport_data.copy()
 
@@ -431,8 +527,6 @@ class ErrorReporter(object):
         if report is not None:
             return report
 
-        loop = asyncio.get_event_loop()
-
         await self.client.errors.wait.GET(error_ref)
 
         path = os.path.join(
@@ -441,6 +535,4 @@ class ErrorReporter(object):
         self.reports.insert(0, report)
         self._reports_by_base[error_ref.base] = report
 
-        loop.call_soon(loop.create_task, report.load())
-
         return report
@@ -0,0 +1,143 @@
+# Copyright 2021 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from subiquitycore.context import Context
+
+from subiquity.common.errorreport import (
+    ErrorReport,
+    ErrorReporter,
+    )
+from subiquity.common.types import ErrorReportState
+
+
+class MockedApplication:
+    project = "subiquity"
+
+    def report_start_event(self, context, description):
+        pass
+
+    def report_finish_event(self, context, description, status):
+        pass
+
+
+class TestErrorReport(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.addCleanup(self.loop.close)
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.reporter = ErrorReporter(
+            Context.new(MockedApplication()), True, tmpdir.name)
+        os.makedirs(self.reporter.crash_directory)
+
+    def make_report(self, state=ErrorReportState.DONE, pr=None):
+        base = "1600000000.000000000.ui"
+        return ErrorReport(
+            reporter=self.reporter, base=base, pr=pr or mock.Mock(),
+            state=state, file=None,
+            context=self.reporter.context.child(base))
+
+    def run_loop(self, delay):
+        self.loop.run_until_complete(asyncio.sleep(delay))
+
+    @mock.patch('subiquity.common.errorreport.write_file')
+    def test_set_meta_coalesces_writes(self, write_file):
+        report = self.make_report()
+        report.set_meta("kind", "UI")
+        report.set_meta("seen", True)
+        report.set_meta("oops-id", "abc")
+        write_file.assert_not_called()
+        self.run_loop(0.1)
+        self.assertEqual(write_file.call_count, 1)
+        path, data = write_file.call_args[0]
+        self.assertEqual(path, report.meta_path)
+        self.assertIn(b'"oops-id"', data)
+
+    @mock.patch('subiquity.common.errorreport.write_file')
+    def test_flush_meta_writes_immediately(self, write_file):
+        report = self.make_report()
+        report.set_meta("seen", True)
+        report.flush_meta()
+        self.assertEqual(write_file.call_count, 1)
+        self.run_loop(0.1)
+        self.assertEqual(write_file.call_count, 1)
+
+    @mock.patch('subiquity.common.errorreport.write_file')
+    def test_flush_meta_logs_write_failure(self, write_file):
+        write_file.side_effect = OSError("disk full")
+        report = self.make_report()
+        report.set_meta("seen", True)
+        with self.assertLogs('subiquitycore.common.errorreport', 'ERROR'):
+            report.flush_meta()
+
+    def test_meta_round_trip(self):
+        report = self.make_report()
+        report.set_meta("kind", "UI")
+        report.mark_seen()
+        report.flush_meta()
+        with open(report.path, 'wb'):
+            pass
+        with mock.patch.dict('sys.modules', apport=mock.Mock()):
+            loaded = ErrorReport.from_file(self.reporter, report.path)
+        self.assertEqual(loaded.base, report.base)
+        self.assertEqual(loaded.meta, {"kind": "UI", "seen": True})
+        self.assertEqual(loaded.state, ErrorReportState.LOADING)
+
+    def test_ensure_loaded_loads_once(self):
+        pr = mock.Mock()
+        report = self.make_report(ErrorReportState.LOADING, pr)
+        with open(report.path, 'wb'):
+            pass
+        report.ensure_loaded()
+        report.ensure_loaded()
+        self.run_loop(0.1)
+        self.assertEqual(pr.load.call_count, 1)
+        self.assertEqual(report.state, ErrorReportState.DONE)
+        report.ensure_loaded()
+        self.run_loop(0.1)
+        self.assertEqual(pr.load.call_count, 1)
+
+    def test_ensure_loaded_failure(self):
+        pr = mock.Mock()
+        pr.load.side_effect = ValueError("bad report")
+        report = self.make_report(ErrorReportState.LOADING, pr)
+        with open(report.path, 'wb'):
+            pass
+        with self.assertLogs('subiquitycore.common.errorreport', 'ERROR'):
+            report.ensure_loaded()
+            self.run_loop(0.1)
+        self.assertEqual(report.state, ErrorReportState.ERROR_LOADING)
+
+    def test_load_reports_does_not_load(self):
+        for base in "1.ui", "2.install_fail":
+            with open(os.path.join(
+                    self.reporter.crash_directory, base + '.crash'), 'wb'):
+                pass
+        with mock.patch.dict('sys.modules', apport=mock.Mock()):
+            self.reporter.load_reports()
+        self.run_loop(0.1)
+        self.assertEqual(
+            [r.base for r in self.reporter.reports],
+            ["2.install_fail", "1.ui"])
+        for report in self.reporter.reports:
+            self.assertEqual(report.state, ErrorReportState.LOADING)
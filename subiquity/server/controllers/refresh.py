@@ -20,6 +20,7 @@ import os
 import requests.exceptions
 
 from subiquitycore.async_helpers import (
+    run_in_thread,
     schedule_task,
     SingleInstanceTask,
     )
@@ -37,6 +38,8 @@ from subiquity.server.controller import (
 
 log = logging.getLogger('subiquity.server.controllers.refresh')
 
+_UNREAD = object()
+
 
 class RefreshController(SubiquityController):
 
@@ -63,6 +66,8 @@ class RefreshController(SubiquityController):
         self.configure_task = None
         self.check_task = None
         self.status = RefreshStatus(availability=RefreshCheckState.UNKNOWN)
+        self._cmdline_channel = self._find_cmdline_channel()
+        self._disk_info_channel = _UNREAD
 
     def load_autoinstall_data(self, data):
         if data is not None:
@@ -102,43 +107,77 @@ class RefreshController(SubiquityController):
 
     @with_context()
     async def configure_snapd(self, context):
-        with context.child("get_details") as subcontext:
-            try:
-                r = await self.app.snapd.get(
-                    'v2/snaps/{snap_name}'.format(
-                        snap_name=self.snap_name))
-            except requests.exceptions.RequestException:
-                log.exception("getting snap details")
-                return
-            self.status.current_snap_version = r['result']['version']
-            for k in 'channel', 'revision', 'version':
-                self.app.note_data_for_apport(
-                    "Snap" + k.title(), r['result'][k])
-            subcontext.description = "current version of snap is: %r" % (
-                self.status.current_snap_version)
+        overridden = (
+            self._cmdline_channel is not None or 'channel' in self.ai_data)
+        if not overridden and self._disk_info_channel is _UNREAD:
+            # Reading the install media can block for a while (e.g. while a
+            # CD spins up), so do it off the event loop.
+            self._disk_info_channel = await run_in_thread(
+                self._read_channel_info)
         channel = self.get_refresh_channel()
-        desc = "switching {} to {}".format(self.snap_name, channel)
-        with context.child("switching", desc) as subcontext:
-            try:
-                await self.app.snapd.post_and_wait(
-                    'v2/snaps/{}'.format(self.snap_name),
-                    {'action': 'switch', 'channel': channel})
-            except requests.exceptions.RequestException:
-                log.exception("switching channels")
-                return
-            subcontext.description = "switched to " + channel
 
-    def get_refresh_channel(self):
-        """Return the channel we should refresh subiquity to."""
+        async def get_details():
+            with context.child("get_details") as subcontext:
+                try:
+                    r = await self.app.snapd.get(
+                        'v2/snaps/{snap_name}'.format(
+                            snap_name=self.snap_name))
+                except requests.exceptions.RequestException:
+                    log.exception("getting snap details")
+                    return
+                self.status.current_snap_version = r['result']['version']
+                for k in 'channel', 'revision', 'version':
+                    self.app.note_data_for_apport(
+                        "Snap" + k.title(), r['result'][k])
+                subcontext.description = (
+                    "current version of snap is: %r" % (
+                        self.status.current_snap_version))
+
+        async def switch():
+            desc = "switching {} to {}".format(self.snap_name, channel)
+            with context.child("switching", desc) as subcontext:
+                try:
+                    await self.app.snapd.post_and_wait(
+                        'v2/snaps/{}'.format(self.snap_name),
+                        {'action': 'switch', 'channel': channel})
+                except requests.exceptions.RequestException:
+                    log.exception("switching channels")
+                    return
+                subcontext.description = "switched to " + channel
+
+        # The two requests are independent, so don't wait for snapd to
+        # answer one before sending the other. The details request is sent
+        # first, so the Snap* values noted for apport are in practice from
+        # before the switch, but that is not guaranteed.
+        #
+        # Let both finish before reporting a failure from either, so that
+        # check_for_update never runs with a switch still in flight.
+        results = await asyncio.gather(
+            get_details(), switch(), return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+
+    def _find_cmdline_channel(self):
         prefix = "subiquity-channel="
         for arg in self.app.kernel_cmdline:
             if arg.startswith(prefix):
                 log.debug(
                     "get_refresh_channel: found %s on kernel cmdline", arg)
                 return arg[len(prefix):]
+
+    def get_refresh_channel(self):
+        """Return the channel we should refresh subiquity to."""
+        if self._cmdline_channel is not None:
+            return self._cmdline_channel
         if 'channel' in self.ai_data:
             return self.ai_data['channel']
+        # The install media does not change under us, so only read it once.
+        if self._disk_info_channel is _UNREAD:
+            self._disk_info_channel = self._read_channel_info()
+        return self._disk_info_channel
 
+    def _read_channel_info(self):
         info_file = '/cdrom/.disk/info'
         try:
             fp = open(info_file)
@@ -191,7 +230,9 @@ class RefreshController(SubiquityController):
 
     @with_context()
     async def start_update(self, context):
-        open(self.app.state_path('updating'), 'w').close()
+        os.close(os.open(
+            self.app.state_path('updating'),
+            os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_CLOEXEC, 0o644))
         change = await self.app.snapd.post(
             'v2/snaps/{}'.format(self.snap_name),
             {'action': 'refresh'})
@@ -0,0 +1,114 @@
+# Copyright 2021 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import unittest
+from unittest import mock
+
+from subiquitycore.context import Context
+
+from subiquity.server.controllers.refresh import RefreshController
+
+
+class FakeSnapd:
+
+    def __init__(self):
+        self.switched_to = None
+
+    async def get(self, path, **kw):
+        return {'result': {
+            'channel': 'stable', 'revision': '1', 'version': '1.0'}}
+
+    async def post_and_wait(self, path, body):
+        await asyncio.sleep(0.01)
+        self.switched_to = body['channel']
+
+
+def make_controller(cmdline=(), ai_data=None, dry_run=False):
+    app = mock.Mock()
+    app.project = "subiquity"
+    app.autoinstall_config = {}
+    app.kernel_cmdline = list(cmdline)
+    app.opts.dry_run = dry_run
+    app.snapd = FakeSnapd()
+    app.context = Context.new(app)
+    controller = RefreshController(app)
+    if ai_data is not None:
+        controller.load_autoinstall_data(ai_data)
+    return controller
+
+
+class TestRefreshChannel(unittest.TestCase):
+
+    def setUp(self):
+        p = mock.patch.object(
+            RefreshController, '_read_channel_info',
+            return_value='stable/ubuntu-20.04')
+        self.read_channel_info = p.start()
+        self.addCleanup(p.stop)
+
+    def run_coro(self, coro):
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        asyncio.set_event_loop(loop)
+        return loop.run_until_complete(coro)
+
+    def test_cmdline_wins(self):
+        c = make_controller(
+            cmdline=['quiet', 'subiquity-channel=edge'],
+            ai_data={'channel': 'beta'})
+        self.assertEqual(c.get_refresh_channel(), 'edge')
+        self.read_channel_info.assert_not_called()
+
+    def test_autoinstall_before_disk_info(self):
+        c = make_controller(cmdline=['quiet'], ai_data={'channel': 'beta'})
+        self.assertEqual(c.get_refresh_channel(), 'beta')
+        self.read_channel_info.assert_not_called()
+
+    def test_disk_info(self):
+        c = make_controller()
+        self.assertEqual(c.get_refresh_channel(), 'stable/ubuntu-20.04')
+        self.assertEqual(c.get_refresh_channel(), 'stable/ubuntu-20.04')
+        self.assertEqual(self.read_channel_info.call_count, 1)
+
+    def test_missing_disk_info_read_once(self):
+        self.read_channel_info.return_value = None
+        c = make_controller()
+        self.assertIsNone(c.get_refresh_channel())
+        self.assertIsNone(c.get_refresh_channel())
+        self.assertEqual(self.read_channel_info.call_count, 1)
+
+    def test_configure_snapd_skips_disk_info_when_overridden(self):
+        c = make_controller(ai_data={'channel': 'beta'})
+        self.run_coro(c.configure_snapd())
+        self.read_channel_info.assert_not_called()
+        self.assertEqual(c.app.snapd.switched_to, 'beta')
+
+    def test_configure_snapd_reads_disk_info_once(self):
+        c = make_controller()
+        self.run_coro(c.configure_snapd())
+        self.assertEqual(c.get_refresh_channel(), 'stable/ubuntu-20.04')
+        self.assertEqual(self.read_channel_info.call_count, 1)
+        self.assertEqual(c.app.snapd.switched_to, 'stable/ubuntu-20.04')
+
+    def test_configure_snapd_switches_when_details_fail(self):
+        c = make_controller()
+
+        async def get(path, **kw):
+            return {'result': {}}
+        c.app.snapd.get = get
+        with self.assertRaises(KeyError):
+            self.run_coro(c.configure_snapd())
+        self.assertEqual(c.app.snapd.switched_to, 'stable/ubuntu-20.04')
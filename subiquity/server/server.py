@@ -420,6 +420,7 @@ class SubiquityServer(Application):
         self.signal.emit_signal('snapd-network-change')
 
     def restart(self):
+        self.error_reporter.flush_meta()
         cmdline = ['snap', 'run', 'subiquity.subiquity-server']
         if self.opts.dry_run:
             cmdline = [
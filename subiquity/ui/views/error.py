@@ -147,6 +147,7 @@ class ErrorReportStretchy(Stretchy):
             self.app.aio_loop.create_task(self._wait())
         else:
             connect_signal(self.report, 'changed', self._report_changed)
+            self.report.ensure_loaded()
             self.report.mark_seen()
         self.interrupting = interrupting
         self.min_wait = self.app.aio_loop.create_task(asyncio.sleep(0.1))
@@ -184,6 +185,7 @@ class ErrorReportStretchy(Stretchy):
             self.error_ref)
         self.error_ref = self.report.ref()
         connect_signal(self.report, 'changed', self._report_changed)
+        self.report.ensure_loaded()
         self.report.mark_seen()
         await self._report_changed_()
 
@@ -323,6 +325,7 @@ class ErrorReportListStretchy(Stretchy):
         self.app.error_reporter.load_reports()
         for report in self.app.error_reporter.reports:
             connect_signal(report, "changed", self._report_changed, report)
+            report.ensure_loaded()
             r = self.report_to_row[report] = self.row_for_report(report)
             rows.append(r)
         self.table = TablePile(rows, colspecs={1: ColSpec(can_shrink=True)})